@@ -1,23 +1,28 @@
 import os
 import tempfile
-import gc
 import re
+import sqlite3
+import threading
+import time
 import uvicorn
 import uuid
 import asyncio
-from typing import List
-from concurrent.futures import ThreadPoolExecutor
+import glob
+import shlex
+import subprocess
+from typing import Callable, List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from pdf2image import convert_from_path
 import pytesseract
 import boto3
 from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 from PyPDF2 import PdfReader
-from PIL import ImageEnhance, ImageFilter
+from PIL import Image, ImageEnhance, ImageFilter
 
 # Cargar variables de entorno
 load_dotenv()
@@ -40,8 +45,62 @@ thread_pool = ThreadPoolExecutor(
     thread_name_prefix="pdf_processor"
 )
 
+# Modo OCR por lotes: agrupa varias páginas en una sola invocación de tesseract
+OCR_BATCH_ENABLED = os.getenv("OCR_BATCH_ENABLED", "false").lower() in ("1", "true", "yes")
+OCR_BATCH_MAX_PAGES = int(os.getenv("OCR_BATCH_MAX_PAGES", "16"))
+# Fracción de la memoria disponible que puede usar un lote (repartida entre los workers)
+OCR_BATCH_MEMORY_FRACTION = float(os.getenv("OCR_BATCH_MEMORY_FRACTION", "0.5"))
+OCR_RENDER_WIDTH = 2000
+PDFTOPPM_CMD = os.getenv("PDFTOPPM_CMD", "pdftoppm")
+# Separador de páginas único para dividir la salida de tesseract por página
+OCR_PAGE_SEPARATOR = "<<<CSJ-OCR-PAGE-BREAK>>>"
+
+# Memoria acotada: techo de RSS del proceso que frena el renderizado (0 = sin techo)
+OCR_RSS_CEILING_MB = int(os.getenv("OCR_RSS_CEILING_MB", "0"))
+OCR_RSS_POLL_SEC = float(os.getenv("OCR_RSS_POLL_SEC", "0.5"))
+# Cuota de archivos temporales (imágenes en disco) por trabajo
+OCR_JOB_SPILL_QUOTA_MB = int(os.getenv("OCR_JOB_SPILL_QUOTA_MB", "512"))
+
+# Páginas en renderizado/OCR en todo el proceso, compartido entre trabajos
+render_condition = threading.Condition()
+render_state = {"active": 0}
+# PIDs de los subprocesos OCR vivos (pdftoppm/tesseract) de todos los trabajos
+child_pids = set()
+child_pids_lock = threading.Lock()
+
+# Deadlines: tiempo máximo por página y por documento en segundos (0 = sin límite)
+OCR_PAGE_TIMEOUT_SEC = float(os.getenv("OCR_PAGE_TIMEOUT_SEC", "300"))
+OCR_DOCUMENT_TIMEOUT_SEC = float(os.getenv("OCR_DOCUMENT_TIMEOUT_SEC", "0"))
+# Tiempo adicional por cada página extra de un lote (el lote dispone de un timeout de página más esto)
+OCR_BATCH_PAGE_ALLOWANCE_SEC = float(os.getenv("OCR_BATCH_PAGE_ALLOWANCE_SEC", "20"))
+# Intervalo de sondeo de cancelación mientras corre un subproceso
+OCR_CANCEL_POLL_SEC = float(os.getenv("OCR_CANCEL_POLL_SEC", "0.2"))
+
+
+# Inventario persistente de prefijos S3 para /ocr/stats
+OCR_INVENTORY_DB = os.getenv("OCR_INVENTORY_DB", os.path.join(tempfile.gettempdir(), "ocr_inventory.db"))
+# Antigüedad máxima del índice antes de refrescarlo incrementalmente en segundo plano.
+# El refresco incremental solo ve llaves posteriores (en orden alfabético) a la última listada,
+# por lo que carpetas nuevas que ordenan antes solo aparecen en el siguiente listado completo
+OCR_INVENTORY_REFRESH_SEC = float(os.getenv("OCR_INVENTORY_REFRESH_SEC", "60"))
+# Cada cuánto se reconcilia el prefijo con un listado completo (llaves nuevas en cualquier
+# posición y borrados); acota cuánto pueden atrasarse las estadísticas
+OCR_INVENTORY_FULL_REFRESH_SEC = float(os.getenv("OCR_INVENTORY_FULL_REFRESH_SEC", "900"))
+OCR_INVENTORY_THROUGHPUT_HOURS = int(os.getenv("OCR_INVENTORY_THROUGHPUT_HOURS", "24"))
+
+# Pool separado para que los refrescos del inventario no compitan con el OCR
+inventory_pool = ThreadPoolExecutor(
+    max_workers=1,
+    thread_name_prefix="inventory_refresh"
+)
+inventory_lock = threading.Lock()
+# Refrescos en curso por (bucket, prefijo); el evento se activa al terminar
+inventory_refreshing = {}
+# Refrescos en segundo plano encolados o en curso, para no encolar duplicados
+inventory_pending = set()
 
 async_tasks = {}
+task_controls = {}
 
 app = FastAPI(
     title="OCR Masivo - AWS Cloud",
@@ -89,53 +148,361 @@ def detect_document_type(text: str) -> str:
     else:
         return 'general'
 
-def process_single_page(pdf_path: str, page_num: int) -> str:
+def read_proc_status_bytes(pid, field: str) -> int:
+    """Lee un campo en kB de /proc/<pid>/status y lo retorna en bytes (0 si no se puede leer)"""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return 0
+
+def get_rss_bytes() -> int:
+    """Retorna el RSS actual del proceso de Python"""
+    return read_proc_status_bytes("self", "VmRSS")
+
+def get_total_rss_bytes() -> int:
+    """RSS del proceso de Python más el de los subprocesos OCR vivos de todos los trabajos"""
+    with child_pids_lock:
+        pids = list(child_pids)
+    return get_rss_bytes() + sum(read_proc_status_bytes(pid, "VmRSS") for pid in pids)
+
+class SpillQuotaExceeded(RuntimeError):
+    """Se lanza cuando renderizar una página excedería la cuota de archivos temporales del trabajo"""
+
+class JobMemory:
+    """
+    Gestiona la memoria de un trabajo OCR: slots de imagen reutilizables en disco,
+    cuota de archivos temporales, freno por techo de RSS y picos de RSS.
+
+    El pico de proceso (Python + subprocesos OCR vivos) es una cifra de todo el proceso:
+    si hay trabajos simultáneos incluye su memoria. El pico de subprocesos sí es del
+    trabajo: el mayor ru_maxrss de sus propios pdftoppm/tesseract, leído al recogerlos
+    """
+    
+    def __init__(self, workdir: str, spill_quota_bytes: int = OCR_JOB_SPILL_QUOTA_MB * 1024 * 1024):
+        self.spill_dir = os.path.join(workdir, "spill")
+        os.makedirs(self.spill_dir, exist_ok=True)
+        self.spill_quota_bytes = spill_quota_bytes
+        self.peak_process_rss_bytes = get_total_rss_bytes()
+        self.peak_subprocess_rss_bytes = 0
+        self.quota_exceeded_pages: List[int] = []
+    
+    @property
+    def peak_process_rss_mb(self) -> float:
+        return round(self.peak_process_rss_bytes / (1024 * 1024), 2)
+    
+    @property
+    def peak_subprocess_rss_mb(self) -> float:
+        return round(self.peak_subprocess_rss_bytes / (1024 * 1024), 2)
+    
+    def sample(self):
+        """Actualiza el pico de RSS del proceso con el RSS actual"""
+        self.peak_process_rss_bytes = max(self.peak_process_rss_bytes, get_total_rss_bytes())
+    
+    def record_subprocess(self, max_rss_bytes: int):
+        """Registra el pico de memoria de un subproceso del trabajo que ya terminó"""
+        self.peak_subprocess_rss_bytes = max(self.peak_subprocess_rss_bytes, max_rss_bytes)
+    
+    def slot_path(self, name: str) -> str:
+        """Ruta de un slot de imagen reutilizable; se sobrescribe en cada página"""
+        return os.path.join(self.spill_dir, f"{name}.png")
+    
+    def spill_usage_bytes(self) -> int:
+        """Bytes ocupados actualmente por los archivos temporales del trabajo"""
+        total = 0
+        for root, _, files in os.walk(self.spill_dir):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    continue
+        return total
+    
+    def reserve(self, projected_bytes: int):
+        """Lanza SpillQuotaExceeded si escribir projected_bytes más superaría la cuota del trabajo"""
+        if self.spill_quota_bytes <= 0:
+            return
+        usage = self.spill_usage_bytes()
+        if usage + projected_bytes > self.spill_quota_bytes:
+            raise SpillQuotaExceeded(
+                f"Cuota de archivos temporales excedida: {usage // (1024 * 1024)} MB usados + "
+                f"{projected_bytes // (1024 * 1024)} MB estimados > {self.spill_quota_bytes // (1024 * 1024)} MB"
+            )
+    
+    @contextmanager
+    def throttle(self, control=None):
+        """
+        Espera a que el RSS baje del techo configurado antes de renderizar. Si no hay
+        otra página en curso se continúa de todas formas para no bloquear el proceso
+        """
+        ceiling = OCR_RSS_CEILING_MB * 1024 * 1024
+        with render_condition:
+            waited = False
+            while ceiling > 0 and render_state["active"] > 0 and get_total_rss_bytes() > ceiling:
+                if control is not None:
+                    control.check()
+                if not waited:
+                    print(f"⏳ RSS sobre el techo de {OCR_RSS_CEILING_MB} MB, esperando para renderizar...")
+                    waited = True
+                render_condition.wait(timeout=OCR_RSS_POLL_SEC)
+            render_state["active"] += 1
+        
+        try:
+            yield
+        finally:
+            self.sample()
+            with render_condition:
+                render_state["active"] -= 1
+                render_condition.notify_all()
+
+class MeasuredPopen(subprocess.Popen):
+    """
+    Popen que recoge al hijo con wait4 para leer su pico real de memoria (ru_maxrss),
+    sin depender de muestrear /proc mientras corre
+    """
+    max_rss_bytes = 0
+    
+    def _try_wait(self, wait_flags):
+        try:
+            pid, status, usage = os.wait4(self.pid, wait_flags)
+        except ChildProcessError:
+            return super()._try_wait(wait_flags)
+        if pid == self.pid:
+            # En Linux ru_maxrss viene en kB
+            self.max_rss_bytes = usage.ru_maxrss * 1024
+        return pid, status
+
+class JobCancelled(Exception):
+    """Se lanza cuando un trabajo OCR fue cancelado"""
+
+class JobControl:
+    """
+    Controla los deadlines de página y documento de un trabajo OCR y su cancelación,
+    terminando los subprocesos que queden colgados
+    """
+    
+    def __init__(self, page_timeout: float = OCR_PAGE_TIMEOUT_SEC, document_timeout: float = OCR_DOCUMENT_TIMEOUT_SEC):
+        self.page_timeout = page_timeout
+        self.document_deadline = time.monotonic() + document_timeout if document_timeout > 0 else None
+        self.cancel_event = threading.Event()
+        self.future: Optional[Future] = None
+        self.processes = set()
+        self.lock = threading.Lock()
+        self.timed_out_pages: List[int] = []
+        # Memoria del trabajo: RSS muestreado mientras corren los subprocesos y su pico al terminar
+        self.memory: Optional[JobMemory] = None
+    
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+    
+    def cancel(self) -> bool:
+        """Cancela el trabajo; retorna True si aún estaba en cola y no llegó a ejecutarse"""
+        self.cancel_event.set()
+        dequeued = self.future.cancel() if self.future else False
+        with self.lock:
+            for proc in list(self.processes):
+                proc.kill()
+        return dequeued
+    
+    def check(self):
+        """Lanza JobCancelled si el trabajo fue cancelado"""
+        if self.cancelled:
+            raise JobCancelled()
+    
+    def document_expired(self) -> bool:
+        return self.document_deadline is not None and time.monotonic() >= self.document_deadline
+    
+    def page_deadline(self, page_count: int = 1) -> Optional[float]:
+        """
+        Deadline absoluto para procesar page_count páginas: un timeout de página más un margen
+        por cada página adicional del lote, acotado por el deadline del documento
+        """
+        seconds = self.page_timeout + OCR_BATCH_PAGE_ALLOWANCE_SEC * (page_count - 1)
+        deadline = time.monotonic() + seconds if self.page_timeout > 0 else None
+        if self.document_deadline is not None:
+            deadline = self.document_deadline if deadline is None else min(deadline, self.document_deadline)
+        return deadline
+    
+    def remaining(self, deadline: Optional[float]) -> Optional[float]:
+        """Segundos restantes hasta el deadline; lanza TimeoutError si ya venció"""
+        self.check()
+        if deadline is None:
+            return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("Deadline de página vencido")
+        return remaining
+    
+    def run(self, cmd: List[str], timeout: Optional[float]) -> subprocess.CompletedProcess:
+        """Ejecuta un subproceso que se termina si vence el timeout o si el trabajo se cancela"""
+        proc = MeasuredPopen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        with self.lock:
+            self.processes.add(proc)
+        with child_pids_lock:
+            child_pids.add(proc.pid)
+        try:
+            start = time.monotonic()
+            while True:
+                try:
+                    stdout, stderr = proc.communicate(timeout=OCR_CANCEL_POLL_SEC)
+                    break
+                except subprocess.TimeoutExpired:
+                    if self.memory is not None:
+                        self.memory.sample()
+                    if self.cancelled or (timeout is not None and time.monotonic() - start >= timeout):
+                        proc.kill()
+                        stdout, stderr = proc.communicate()
+                        self.check()
+                        # Se conserva la salida parcial del proceso para quien la necesite
+                        raise subprocess.TimeoutExpired(cmd, timeout, output=stdout, stderr=stderr)
+            self.check()
+            return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+        finally:
+            with self.lock:
+                self.processes.discard(proc)
+            with child_pids_lock:
+                child_pids.discard(proc.pid)
+            if self.memory is not None:
+                self.memory.record_subprocess(proc.max_rss_bytes)
+
+def is_timeout_error(error: Exception) -> bool:
+    """Indica si un error corresponde a un deadline vencido (pdftoppm, tesseract o página)"""
+    return isinstance(error, (TimeoutError, subprocess.TimeoutExpired))
+
+def render_pages(pdf_path: str, first_page: int, last_page: int, output_prefix: str, control: JobControl,
+                 timeout: Optional[float], single_file: bool = False) -> List[str]:
+    """
+    Renderiza las páginas [first_page, last_page] (base 1) a PNG en escala de grises con pdftoppm.
+    Se ejecuta bajo JobControl para que la cancelación o el deadline terminen el proceso
+    """
+    cmd = [
+        PDFTOPPM_CMD,
+        "-f", str(first_page),
+        "-l", str(last_page),
+        "-scale-to-x", str(OCR_RENDER_WIDTH),
+        "-scale-to-y", "-1",  # Mantener la proporción de la página
+        "-gray",
+        "-png",
+        *(["-singlefile"] if single_file else []),
+        pdf_path,
+        output_prefix,
+    ]
+    result = control.run(cmd, timeout)
+    if result.returncode != 0:
+        raise RuntimeError(f"pdftoppm terminó con código {result.returncode}: {result.stderr.decode('utf-8', 'replace').strip()}")
+    
+    if single_file:
+        return [f"{output_prefix}.png"] if os.path.exists(f"{output_prefix}.png") else []
+    # pdftoppm numera con ceros a la izquierda, por lo que el orden alfabético es el de las páginas
+    return sorted(glob.glob(f"{glob.escape(output_prefix)}-*.png"))
+
+def run_tesseract(input_path: str, control: JobControl, timeout: Optional[float],
+                  extra_args: Optional[List[str]] = None, output_base: Optional[str] = None) -> str:
+    """
+    Ejecuta tesseract sobre una imagen (o lista de imágenes) y retorna el texto reconocido,
+    leído de stdout o del archivo output_base.txt si se indica
+    """
+    cmd = [
+        pytesseract.pytesseract.tesseract_cmd,
+        input_path,
+        output_base or "stdout",
+        "-l", "spa",
+        *shlex.split(get_optimal_config()),
+        *(extra_args or []),
+    ]
+    result = control.run(cmd, timeout)
+    if result.returncode != 0:
+        raise RuntimeError(f"tesseract terminó con código {result.returncode}: {result.stderr.decode('utf-8', 'replace').strip()}")
+    if output_base:
+        with open(f"{output_base}.txt", encoding="utf-8", errors="replace") as f:
+            return f.read()
+    return result.stdout.decode("utf-8", "replace")
+
+def process_single_page(pdf_path: str, page_num: int, memory: Optional[JobMemory] = None,
+                        control: Optional[JobControl] = None, pdf: Optional[PdfReader] = None) -> str:
     """Procesa una sola página del PDF y retorna el texto extraído de forma optimizada"""
     
-    # Primero intentar con pdf2image + OCR
+    if memory is None:
+        with tempfile.TemporaryDirectory() as workdir:
+            return process_single_page(pdf_path, page_num, JobMemory(workdir), control, pdf)
+    if control is None:
+        control = JobControl()
+    if control.memory is None:
+        control.memory = memory
+    
+    deadline = control.page_deadline()
+    
+    # Primero intentar con pdftoppm + OCR
     try:
-        images = convert_from_path(
+        # Liberar los slots de la página anterior y verificar la cuota antes de renderizar:
+        # conviven la imagen renderizada y la mejorada
+        for slot in ("raster", "ocr"):
+            if os.path.exists(memory.slot_path(slot)):
+                os.remove(memory.slot_path(slot))
+        memory.reserve(estimate_raster_bytes(pdf, page_num) * 2)
+        
+        # Renderizar directamente al slot reutilizable del trabajo, sin copia en memoria
+        rendered = render_pages(
             pdf_path,
-            first_page=page_num + 1,
-            last_page=page_num + 1,
-            thread_count=1,
-            grayscale=True,
-            size=(2000, None)  # Mayor resolución para mejor calidad
+            page_num + 1,
+            page_num + 1,
+            os.path.join(memory.spill_dir, "raster"),
+            control,
+            control.remaining(deadline),
+            single_file=True
         )
         
         text = ""
-        config = get_optimal_config()
         
-        if images:
-            img = images[0]
+        if rendered:
+            ocr_path = memory.slot_path("ocr")
             try:
-                # Mejorar imagen para OCR
-                enhanced_img = enhance_image_quality(img)
+                # Mejorar imagen para OCR; las imágenes se cierran antes de llamar a tesseract
+                with Image.open(rendered[0]) as img:
+                    enhanced_img = enhance_image_quality(img)
+                    enhanced_img.save(ocr_path)
+                    enhanced_img.close()
+                memory.sample()
                 
                 # Extraer texto con configuración optimizada
-                page_text = pytesseract.image_to_string(enhanced_img, lang="spa", config=config)
+                page_text = run_tesseract(ocr_path, control, control.remaining(deadline))
                 text = page_text
                 print(f"✅ OCR exitoso en página {page_num + 1}")
                 
+            except JobCancelled:
+                raise
             except Exception as e:
                 print(f"⚠️ Error en OCR página {page_num + 1}: {repr(e)}")
+                if is_timeout_error(e):
+                    control.timed_out_pages.append(page_num + 1)
                 text = ""
-            
-            img.close()
-        
-        images.clear()
-        gc.collect()
         
         if text and text.strip():
             return text
             
-    except Exception as pdf2image_error:
-        print(f"⚠️ pdf2image falló: {pdf2image_error}")
+    except JobCancelled:
+        raise
+    except SpillQuotaExceeded as quota_error:
+        print(f"⚠️ Página {page_num + 1} sin OCR: {quota_error}")
+        memory.quota_exceeded_pages.append(page_num + 1)
+    except Exception as render_error:
+        print(f"⚠️ pdftoppm falló: {render_error}")
+        if is_timeout_error(render_error):
+            control.timed_out_pages.append(page_num + 1)
     
     # Fallback: usar PyPDF2 directamente
+    return extract_text_layer(pdf_path, page_num, pdf)
+
+def extract_text_layer(pdf_path: str, page_num: int, pdf: Optional[PdfReader] = None) -> str:
+    """Extrae el texto embebido de una página con PyPDF2 (fallback cuando el OCR no produce texto)"""
     try:
         print(f"💡 Intentando extraer texto directamente del PDF...")
-        pdf = PdfReader(pdf_path)
+        if pdf is None:
+            pdf = PdfReader(pdf_path)
         if page_num < len(pdf.pages):
             page = pdf.pages[page_num]
             text = page.extract_text()
@@ -150,6 +517,268 @@ def process_single_page(pdf_path: str, page_num: int) -> str:
     
     return ""
 
+def get_available_memory_bytes() -> int:
+    """Retorna la memoria disponible del sistema según /proc/meminfo (0 si no se puede leer)"""
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return 0
+
+def estimate_raster_bytes(pdf: Optional[PdfReader], page_num: int) -> int:
+    """Tamaño estimado de la página renderizada en escala de grises (1 byte por píxel, sin comprimir)"""
+    ratio = 1.65  # Proporción de oficio si no se puede leer la página
+    try:
+        box = pdf.pages[page_num].mediabox
+        if float(box.width) > 0:
+            ratio = float(box.height) / float(box.width)
+    except Exception:
+        pass
+    return int(OCR_RENDER_WIDTH * OCR_RENDER_WIDTH * ratio)
+
+def compute_batch_size(pdf: PdfReader, first_page: int, max_pages: int = OCR_BATCH_MAX_PAGES,
+                       spill_quota_bytes: int = 0) -> int:
+    """
+    Calcula cuántas páginas agrupar en una invocación de tesseract según el tamaño
+    de la página renderizada, la memoria disponible y la cuota de archivos temporales
+    """
+    # Tesseract mantiene varias copias internas de la imagen
+    raster_bytes = estimate_raster_bytes(pdf, first_page)
+    page_bytes = raster_bytes * 4
+    
+    # En disco conviven la imagen renderizada y la mejorada de cada página del lote
+    if spill_quota_bytes > 0:
+        max_pages = min(max_pages, spill_quota_bytes // max(1, raster_bytes * 2))
+    
+    available = get_available_memory_bytes()
+    if available <= 0:
+        return max(1, max_pages)
+    
+    budget = int(available * OCR_BATCH_MEMORY_FRACTION / max(1, MAX_WORKERS))
+    return max(1, min(max_pages, budget // max(1, page_bytes)))
+
+def split_batch_output(output: str, expected_pages: int) -> Optional[List[str]]:
+    """
+    Divide la salida de tesseract en el texto de cada página usando el separador de página.
+    Retorna None si el número de páginas no coincide con el esperado
+    """
+    parts = output.split(OCR_PAGE_SEPARATOR)
+    # Tesseract agrega el separador después de cada página, incluida la última: N páginas
+    # producen N separadores. Así una página vacía no se confunde con el separador final
+    if len(parts) != expected_pages + 1 or parts[-1].strip():
+        return None
+    return parts[:-1]
+
+def run_tesseract_batch(image_paths: List[str], workdir: str, control: JobControl,
+                        timeout: Optional[float]) -> Optional[List[str]]:
+    """
+    Ejecuta una sola invocación de tesseract sobre una lista de imágenes y retorna el texto por página.
+    La salida va a batch_output_path(workdir) para poder leer las páginas terminadas si el lote vence
+    """
+    list_file = os.path.join(workdir, "batch_list.txt")
+    with open(list_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(image_paths) + "\n")
+    
+    output = run_tesseract(
+        list_file, control, timeout, ["-c", f"page_separator={OCR_PAGE_SEPARATOR}"],
+        output_base=os.path.join(workdir, "batch_output")
+    )
+    return split_batch_output(output, len(image_paths))
+
+def batch_output_path(workdir: str) -> str:
+    return os.path.join(workdir, "batch_output.txt")
+
+def completed_batch_pages(workdir: str):
+    """
+    Texto de las páginas que tesseract terminó antes de ser detenido y momento (epoch) en que
+    terminó la última: cada página completa va seguida del separador y tesseract vacía el
+    archivo de salida al terminar cada página, por lo que su mtime marca el fin de la última
+    """
+    output_path = batch_output_path(workdir)
+    if not os.path.exists(output_path):
+        return [], None
+    with open(output_path, encoding="utf-8", errors="replace") as f:
+        done = f.read().split(OCR_PAGE_SEPARATOR)[:-1]
+    return done, os.path.getmtime(output_path) if done else None
+
+def last_rendered_at(paths: List[str]) -> Optional[float]:
+    """Momento (epoch) en que pdftoppm terminó la última de las páginas ya escritas"""
+    return max((os.path.getmtime(path) for path in paths), default=None)
+
+def process_page_batch(pdf_path: str, first_page: int, last_page: int, pdf: Optional[PdfReader] = None,
+                       memory: Optional[JobMemory] = None, control: Optional[JobControl] = None,
+                       fallback: bool = True) -> List[str]:
+    """
+    Procesa las páginas [first_page, last_page) con un solo render de pdftoppm y una sola
+    invocación de tesseract. Si el lote falla, las páginas sin OCR se procesan página por
+    página (o se relanza el error si fallback es False). Si el lote venció su deadline, las
+    páginas ya reconocidas no se repiten; la página en proceso usa la capa de texto solo si
+    ella misma superó OCR_PAGE_TIMEOUT_SEC, si no se reintenta sola con su propio deadline
+    """
+    page_count = last_page - first_page
+    if control is None:
+        control = JobControl()
+    
+    deadline = control.page_deadline(page_count)
+    pages_text: List[Optional[str]] = [None] * page_count
+    # Posición en el lote de la página que estaba en proceso cuando venció el deadline
+    # y momento (epoch) en que empezó esa página
+    hung_offset = None
+    hung_started_at = None
+    
+    try:
+        if memory:
+            memory.reserve(sum(estimate_raster_bytes(pdf, page_num) * 2 for page_num in range(first_page, last_page)))
+        
+        with tempfile.TemporaryDirectory(dir=memory.spill_dir if memory else None) as batch_dir:
+            # Renderizar el rango completo directamente a disco
+            raw_prefix = os.path.join(batch_dir, "raw")
+            started_at = time.time()
+            try:
+                raw_paths = render_pages(pdf_path, first_page + 1, last_page, raw_prefix, control, control.remaining(deadline))
+            except subprocess.TimeoutExpired:
+                # pdftoppm escribe cada página al terminarla: la siguiente es la que colgó
+                rendered = glob.glob(f"{glob.escape(raw_prefix)}-*.png")
+                hung_offset = len(rendered)
+                hung_started_at = last_rendered_at(rendered) or started_at
+                raise
+            
+            if len(raw_paths) != page_count:
+                raise RuntimeError(f"pdftoppm generó {len(raw_paths)} de {page_count} páginas")
+            
+            # Mejorar cada imagen y guardarla para tesseract
+            image_paths = []
+            for i, raw_path in enumerate(raw_paths):
+                with Image.open(raw_path) as img:
+                    enhanced_img = enhance_image_quality(img)
+                    enhanced_path = os.path.join(batch_dir, f"page-{i:05d}.png")
+                    enhanced_img.save(enhanced_path)
+                    enhanced_img.close()
+                os.remove(raw_path)
+                image_paths.append(enhanced_path)
+            
+            started_at = time.time()
+            try:
+                batch_text = run_tesseract_batch(image_paths, batch_dir, control, control.remaining(deadline))
+            except subprocess.TimeoutExpired:
+                done, finished_at = completed_batch_pages(batch_dir)
+                pages_text[:len(done)] = done
+                hung_offset = len(done)
+                hung_started_at = finished_at or started_at
+                raise
+        
+        if batch_text is None:
+            raise RuntimeError("la salida de tesseract no coincide con el número de páginas del lote")
+        
+        pages_text = batch_text
+        print(f"✅ OCR por lotes exitoso en páginas {first_page + 1}-{last_page}")
+    
+    except JobCancelled:
+        raise
+    except Exception as e:
+        print(f"⚠️ Error en OCR por lotes páginas {first_page + 1}-{last_page}: {repr(e)}")
+        if not fallback:
+            raise
+        
+        for offset in range(page_count):
+            page_num = first_page + offset
+            if pages_text[offset] is not None:
+                continue
+            if (offset == hung_offset and control.page_timeout > 0
+                    and time.time() - hung_started_at >= control.page_timeout):
+                # No se repite el OCR de la página que colgó el lote por sí sola
+                control.timed_out_pages.append(page_num + 1)
+                pages_text[offset] = extract_text_layer(pdf_path, page_num, pdf)
+            else:
+                # Página por página se aíslan las páginas restantes del lote
+                pages_text[offset] = process_single_page(pdf_path, page_num, memory, control, pdf)
+    
+    # Fallback por página: usar la capa de texto del PDF si el OCR no produjo texto
+    results = []
+    for offset, text in enumerate(pages_text):
+        if text and text.strip():
+            results.append(text)
+        else:
+            results.append(extract_text_layer(pdf_path, first_page + offset, pdf))
+    return results
+
+def process_pdf_pages(pdf_path: str, total_pages: int, on_progress: Optional[Callable[[int], None]] = None,
+                      memory: Optional[JobMemory] = None, control: Optional[JobControl] = None) -> List[str]:
+    """
+    Procesa todas las páginas del PDF y retorna la lista de textos no vacíos.
+    Usa el modo por lotes si OCR_BATCH_ENABLED está activo. Si vence el deadline
+    del documento, las páginas restantes usan solo la capa de texto del PDF
+    """
+    if memory is None:
+        with tempfile.TemporaryDirectory() as workdir:
+            return process_pdf_pages(pdf_path, total_pages, on_progress, JobMemory(workdir), control)
+    if control is None:
+        control = JobControl()
+    control.memory = memory
+    
+    all_pages_text = []
+    pdf = PdfReader(pdf_path)
+    
+    def collect(page_num: int, page_text: str):
+        if page_text and page_text.strip():
+            all_pages_text.append(page_text)
+        
+        if on_progress:
+            on_progress(page_num + 1)
+        
+        # Progreso cada 10 páginas
+        if (page_num + 1) % 10 == 0:
+            print(f"✅ Procesadas {page_num + 1}/{total_pages} páginas")
+    
+    def collect_text_layer(first_page: int):
+        print(f"⏰ Deadline del documento vencido, páginas {first_page + 1}-{total_pages} solo con capa de texto")
+        for page_num in range(first_page, total_pages):
+            control.check()
+            control.timed_out_pages.append(page_num + 1)
+            collect(page_num, extract_text_layer(pdf_path, page_num, pdf))
+    
+    if OCR_BATCH_ENABLED:
+        page_num = 0
+        while page_num < total_pages:
+            control.check()
+            if control.document_expired():
+                collect_text_layer(page_num)
+                break
+            batch_size = compute_batch_size(pdf, page_num, spill_quota_bytes=memory.spill_quota_bytes)
+            last_page = min(total_pages, page_num + batch_size)
+            try:
+                with memory.throttle(control):
+                    batch_text = process_page_batch(pdf_path, page_num, last_page, pdf, memory, control)
+            except JobCancelled:
+                raise
+            except Exception as e:
+                print(f"Error en páginas {page_num + 1}-{last_page}: {repr(e)}")
+                batch_text = [""] * (last_page - page_num)
+            for offset, page_text in enumerate(batch_text):
+                collect(page_num + offset, page_text)
+            page_num = last_page
+        return all_pages_text
+    
+    for page_num in range(total_pages):
+        control.check()
+        if control.document_expired():
+            collect_text_layer(page_num)
+            break
+        try:
+            with memory.throttle(control):
+                page_text = process_single_page(pdf_path, page_num, memory, control, pdf)
+            collect(page_num, page_text)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            print(f"Error en página {page_num + 1}: {repr(e)}")
+            continue
+    
+    return all_pages_text
+
 def clean_and_format_text(text: str) -> str:
     """Limpia y formatea el texto extraído de forma optimizada"""
     if not text or not text.strip():
@@ -254,6 +883,288 @@ def extract_folder_id_from_pdf_name(pdf_key: str) -> str:
     
     return clean_name[:10] if clean_name else "doc-001"
 
+def get_inventory_connection() -> sqlite3.Connection:
+    """Abre una conexión al inventario de prefijos y crea las tablas si no existen"""
+    conn = sqlite3.connect(OCR_INVENTORY_DB, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS objects (
+            bucket TEXT NOT NULL,
+            key TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            ext TEXT NOT NULL,
+            stem TEXT NOT NULL,
+            folder_id TEXT NOT NULL DEFAULT '',
+            seen_at REAL NOT NULL,
+            PRIMARY KEY (bucket, key)
+        );
+        CREATE TABLE IF NOT EXISTS prefixes (
+            bucket TEXT NOT NULL,
+            prefix TEXT NOT NULL,
+            refreshed_at REAL NOT NULL,
+            full_refreshed_at REAL NOT NULL,
+            cursor TEXT,
+            PRIMARY KEY (bucket, prefix)
+        );
+        CREATE TABLE IF NOT EXISTS outputs (
+            bucket TEXT NOT NULL,
+            key TEXT NOT NULL,
+            pages INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            source_bucket TEXT,
+            source_key TEXT
+        );
+        CREATE INDEX IF NOT EXISTS outputs_created ON outputs (bucket, created_at);
+    """)
+    ensure_inventory_columns(conn, "prefixes", {"cursor": "TEXT"})
+    added = ensure_inventory_columns(conn, "objects", {"folder_id": "TEXT NOT NULL DEFAULT ''"})
+    if "folder_id" in added:
+        # Inventario anterior a la columna: calcular la carpeta de los objetos ya indexados
+        conn.executemany(
+            "UPDATE objects SET folder_id = ? WHERE bucket = ? AND key = ?",
+            [(inventory_folder_id(key, ext), bucket, key)
+             for bucket, key, ext in conn.execute("SELECT bucket, key, ext FROM objects").fetchall()]
+        )
+        conn.commit()
+    conn.execute("DROP INDEX IF EXISTS objects_stem")
+    conn.execute("CREATE INDEX IF NOT EXISTS objects_folder ON objects (bucket, ext, stem, folder_id)")
+    ensure_inventory_columns(conn, "outputs", {"source_bucket": "TEXT", "source_key": "TEXT"})
+    conn.execute("CREATE INDEX IF NOT EXISTS outputs_source ON outputs (source_bucket, source_key)")
+    return conn
+
+def ensure_inventory_columns(conn: sqlite3.Connection, table: str, columns: dict) -> List[str]:
+    """Agrega a una tabla existente del inventario las columnas que le falten y retorna las agregadas"""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    added = []
+    for name, declaration in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {declaration}")
+            added.append(name)
+    conn.commit()
+    return added
+
+def prefix_upper_bound(prefix: str) -> str:
+    """Límite superior para consultar por rango todas las llaves que empiezan con el prefijo"""
+    return prefix + "\U0010ffff"
+
+def split_key_name(key: str):
+    """Retorna (extensión en minúsculas, nombre sin extensión) de una llave de S3"""
+    stem, ext = os.path.splitext(os.path.basename(key))
+    return ext.lower().lstrip("."), stem
+
+def inventory_folder_id(key: str, ext: str) -> str:
+    """
+    Carpeta del expediente de una llave, para relacionar un PDF con su .txt sin comparar rutas:
+    en los PDF es la carpeta padre (digitalizaciones_csj/<id>/archivo.pdf); en las salidas es el
+    segmento siguiente a processing/ (processing/<id>/resources/split_text/archivo.txt) o, si no
+    lo hay, la carpeta padre
+    """
+    parts = key.split("/")[:-1]
+    if ext != "pdf" and "processing" in parts[:-1]:
+        return parts[parts.index("processing") + 1]
+    return parts[-1] if parts else ""
+
+def upsert_inventory_objects(conn: sqlite3.Connection, bucket: str, objects: List[dict], seen_at: float):
+    """Inserta o actualiza objetos listados en S3 en el inventario"""
+    rows = []
+    for obj in objects:
+        ext, stem = split_key_name(obj["Key"])
+        rows.append((bucket, obj["Key"], obj["Size"], ext, stem, inventory_folder_id(obj["Key"], ext), seen_at))
+    conn.executemany(
+        "INSERT OR REPLACE INTO objects (bucket, key, size, ext, stem, folder_id, seen_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        rows
+    )
+
+def find_indexed_prefix(conn: sqlite3.Connection, bucket: str, prefix: str):
+    """Busca el prefijo indexado que cubre al prefijo pedido (el mismo o uno más corto)"""
+    return conn.execute(
+        "SELECT prefix, refreshed_at, full_refreshed_at FROM prefixes "
+        "WHERE bucket = ? AND substr(?, 1, length(prefix)) = prefix "
+        "ORDER BY length(prefix) DESC LIMIT 1",
+        (bucket, prefix)
+    ).fetchone()
+
+def refresh_prefix_inventory(bucket: str, prefix: str, full: bool = False, wait: bool = False) -> bool:
+    """
+    Refresca el inventario de un prefijo desde S3. El modo incremental solo lista las llaves
+    posteriores al cursor del prefijo (la última llave vista en un listado de S3); el modo
+    completo lista todo el prefijo y reconcilia también los borrados.
+
+    Si ya hay un refresco del mismo prefijo en curso: con wait espera a que termine y luego
+    hace el suyo; sin wait lo omite. Retorna True si el refresco se realizó
+    """
+    refresh_key = (bucket, prefix)
+    while True:
+        with inventory_lock:
+            running = inventory_refreshing.get(refresh_key)
+            if running is None:
+                done = threading.Event()
+                inventory_refreshing[refresh_key] = done
+                break
+        if not wait:
+            return False
+        running.wait()
+    
+    try:
+        conn = get_inventory_connection()
+        try:
+            started_at = time.time()
+            indexed = conn.execute(
+                "SELECT full_refreshed_at, cursor FROM prefixes WHERE bucket = ? AND prefix = ?",
+                (bucket, prefix)
+            ).fetchone()
+            full = full or indexed is None or started_at - indexed[0] >= OCR_INVENTORY_FULL_REFRESH_SEC
+            
+            # El cursor sale solo de listados de S3, nunca de las salidas que registra el pipeline
+            cursor = None if full else indexed[1]
+            params = {"Bucket": bucket, "Prefix": prefix}
+            if cursor:
+                params["StartAfter"] = cursor
+            
+            print(f"🔍 Refrescando inventario {'completo' if full else 'incremental'}: {bucket}/{prefix}")
+            
+            listed = 0
+            paginator = s3_client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(**params):
+                contents = page.get('Contents', [])
+                upsert_inventory_objects(conn, bucket, contents, started_at)
+                conn.commit()
+                listed += len(contents)
+                if contents:
+                    cursor = max(cursor or "", contents[-1]["Key"])
+            
+            if full:
+                # Lo que no apareció en el listado completo ya no existe en S3
+                conn.execute(
+                    "DELETE FROM objects WHERE bucket = ? AND key >= ? AND key < ? AND seen_at < ?",
+                    (bucket, prefix, prefix_upper_bound(prefix), started_at)
+                )
+            
+            conn.execute(
+                "INSERT INTO prefixes (bucket, prefix, refreshed_at, full_refreshed_at, cursor) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (bucket, prefix) DO UPDATE SET refreshed_at = excluded.refreshed_at, "
+                "cursor = excluded.cursor, "
+                "full_refreshed_at = CASE WHEN ? THEN excluded.full_refreshed_at ELSE full_refreshed_at END",
+                (bucket, prefix, started_at, started_at, cursor, full)
+            )
+            conn.commit()
+            print(f"✅ Inventario refrescado: {bucket}/{prefix} ({listed} objetos listados)")
+        finally:
+            conn.close()
+    finally:
+        with inventory_lock:
+            inventory_refreshing.pop(refresh_key, None)
+        done.set()
+    
+    return True
+
+def submit_inventory_refresh(bucket: str, prefix: str) -> bool:
+    """
+    Encola un refresco incremental en segundo plano, salvo que ya haya uno encolado o en curso
+    para el mismo prefijo. Retorna True si se encoló
+    """
+    refresh_key = (bucket, prefix)
+    with inventory_lock:
+        if refresh_key in inventory_pending or refresh_key in inventory_refreshing:
+            return False
+        inventory_pending.add(refresh_key)
+    
+    def run_refresh():
+        try:
+            refresh_prefix_inventory(bucket, prefix)
+        finally:
+            with inventory_lock:
+                inventory_pending.discard(refresh_key)
+    
+    def log_refresh_error(future: Future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"❌ Error refrescando inventario de {bucket}/{prefix}: {repr(future.exception())}")
+    
+    inventory_pool.submit(run_refresh).add_done_callback(log_refresh_error)
+    return True
+
+def record_inventory_output(bucket: str, key: str, local_path: str, pages: int, source_bucket: str, source_key: str):
+    """
+    Registra en el inventario un archivo escrito por el pipeline OCR, sin esperar al listado de S3,
+    junto con el PDF de origen para saber qué PDFs ya fueron procesados
+    """
+    try:
+        now = time.time()
+        conn = get_inventory_connection()
+        try:
+            upsert_inventory_objects(conn, bucket, [{"Key": key, "Size": os.path.getsize(local_path)}], now)
+            conn.execute(
+                "INSERT INTO outputs (bucket, key, pages, created_at, source_bucket, source_key) VALUES (?, ?, ?, ?, ?, ?)",
+                (bucket, key, pages, now, source_bucket, source_key)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception as e:
+        # El inventario nunca debe hacer fallar el OCR
+        print(f"⚠️ Error actualizando inventario: {repr(e)}")
+
+def query_prefix_stats(conn: sqlite3.Connection, bucket: str, prefix: str) -> dict:
+    """Calcula las estadísticas de un prefijo a partir del inventario local"""
+    upper = prefix_upper_bound(prefix)
+    
+    total_files, total_size = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects WHERE bucket = ? AND key >= ? AND key < ?",
+        (bucket, prefix, upper)
+    ).fetchone()
+    
+    files_by_type = {
+        (ext or "sin_extension"): count
+        for ext, count in conn.execute(
+            "SELECT ext, COUNT(*) FROM objects WHERE bucket = ? AND key >= ? AND key < ? "
+            "GROUP BY ext ORDER BY COUNT(*) DESC",
+            (bucket, prefix, upper)
+        )
+    }
+    
+    # PDFs pendientes: sin salida registrada por el pipeline para esa llave. Para salidas
+    # anteriores al registro, un .txt con el mismo nombre y la misma carpeta de expediente
+    # (p. ej. processing/<id>/resources/split_text/ para digitalizaciones_csj/<id>/), por índice
+    pending_pdfs = conn.execute(
+        "SELECT COUNT(*) FROM objects AS pdf WHERE pdf.bucket = ? AND pdf.key >= ? AND pdf.key < ? "
+        "AND pdf.ext = 'pdf' AND NOT EXISTS ("
+        "  SELECT 1 FROM outputs WHERE outputs.source_bucket = pdf.bucket AND outputs.source_key = pdf.key"
+        ") AND NOT EXISTS ("
+        "  SELECT 1 FROM objects AS txt WHERE txt.bucket = pdf.bucket AND txt.ext = 'txt' "
+        "  AND txt.stem = pdf.stem AND txt.folder_id = pdf.folder_id AND pdf.folder_id != '')",
+        (bucket, prefix, upper)
+    ).fetchone()[0]
+    
+    since = time.time() - OCR_INVENTORY_THROUGHPUT_HOURS * 3600
+    throughput = [
+        {"hour": hour, "documents": documents, "pages": pages}
+        for hour, documents, pages in conn.execute(
+            "SELECT strftime('%Y-%m-%dT%H:00:00Z', created_at, 'unixepoch') AS hour, COUNT(*), SUM(pages) "
+            "FROM outputs WHERE bucket = ? AND created_at >= ? AND key >= ? AND key < ? "
+            "GROUP BY hour ORDER BY hour",
+            (bucket, since, prefix, upper)
+        )
+    ]
+    
+    pdf_files = files_by_type.get("pdf", 0)
+    txt_files = files_by_type.get("txt", 0)
+    
+    return {
+        "total_files": total_files,
+        "total_size_mb": round(total_size / (1024 * 1024), 2),
+        "pdf_files": pdf_files,
+        "txt_files": txt_files,
+        "processed_ratio": f"{txt_files}/{pdf_files}" if pdf_files > 0 else "0/0",
+        "pending_pdfs": pending_pdfs,
+        "files_by_type": files_by_type,
+        "throughput": {
+            "window_hours": OCR_INVENTORY_THROUGHPUT_HOURS,
+            "documents": sum(item["documents"] for item in throughput),
+            "pages": sum(item["pages"] for item in throughput),
+            "hourly": throughput
+        }
+    }
+
 # Modelos Pydantic
 class ProcessPDFRequest(BaseModel):
     source_bucket: str
@@ -291,6 +1202,7 @@ async def root():
             "process_multiple_pdfs": "/ocr/process-multiple",
             "process_folder": "/ocr/process-folder",
             "async_state": "/ocr/async-state/{task_id}",
+            "cancel_async_task": "DELETE /ocr/async-state/{task_id}",
             "stats": "/ocr/stats/{bucket}/{prefix:path}"
         }
     }
@@ -322,22 +1234,10 @@ async def process_single_pdf(req: ProcessPDFRequest):
             print(f"📄 PDF tiene {total_pages} páginas")
             
             # Procesar todas las páginas
-            all_pages_text = []
-            for page_num in range(total_pages):
-                try:
-                    page_text = process_single_page(local_pdf, page_num)
-                    if page_text and page_text.strip():
-                        all_pages_text.append(page_text)
-                    
-                    # Progreso cada 10 páginas
-                    if (page_num + 1) % 10 == 0:
-                        print(f"✅ Procesadas {page_num + 1}/{total_pages} páginas")
-                    
-                    # Limpiar memoria periódicamente
-                    gc.collect()
-                except Exception as e:
-                    print(f"Error en página {page_num + 1}: {e}")
-                    continue
+            memory = JobMemory(tmpdir)
+            control = JobControl()
+            all_pages_text = process_pdf_pages(local_pdf, total_pages, memory=memory, control=control)
+            print(f"📊 Pico de RSS del proceso: {memory.peak_process_rss_mb} MB, subprocesos del trabajo: {memory.peak_subprocess_rss_mb} MB")
             
             if not all_pages_text:
                 raise HTTPException(status_code=422, detail="No se pudo extraer texto del PDF")
@@ -360,6 +1260,7 @@ async def process_single_pdf(req: ProcessPDFRequest):
             # Subir a S3 en la estructura correcta: processing/{folder_id}/resources/split_text/
             s3_key = req.dest_key
             s3_client.upload_file(local_txt, req.source_bucket, s3_key)
+            record_inventory_output(req.source_bucket, s3_key, local_txt, total_pages, req.source_bucket, req.source_pdf_key)
             
             print(f"✅ Archivo subido: {s3_key}")
             
@@ -371,7 +1272,11 @@ async def process_single_pdf(req: ProcessPDFRequest):
                 "total_pages": total_pages,
                 "s3_key": s3_key,
                 "pages_processed": len(all_pages_text),
-                "document_type": doc_type
+                "document_type": doc_type,
+                "peak_process_rss_mb": memory.peak_process_rss_mb,
+                "peak_subprocess_rss_mb": memory.peak_subprocess_rss_mb,
+                "quota_exceeded_pages": memory.quota_exceeded_pages,
+                "timed_out_pages": control.timed_out_pages
             }
             
         except Exception as e:
@@ -401,9 +1306,12 @@ async def process_single_pdf_async(req: ProcessPDFRequestAsync, background_tasks
         "state": "In Progress",
         "progress": "0/0"
     }
+    control = JobControl()
+    task_controls[task_id] = control
     
     def process_pdf_background():
         try:
+            control.check()
             with tempfile.TemporaryDirectory() as tmpdir:
                 local_pdf = os.path.join(tmpdir, "input.pdf")
                 
@@ -411,6 +1319,9 @@ async def process_single_pdf_async(req: ProcessPDFRequestAsync, background_tasks
                     print(f"🔄 Descargando PDF: {req.source_pdf_key}")
                     s3_client.download_file(req.source_bucket, req.source_pdf_key, local_pdf)
                     print(f"✅ PDF descargado exitosamente")
+                    control.check()
+                except JobCancelled:
+                    raise
                 except Exception as e:
                     async_tasks[task_id] = {
                         "state": "Error",
@@ -429,31 +1340,22 @@ async def process_single_pdf_async(req: ProcessPDFRequestAsync, background_tasks
                     async_tasks[task_id]["progress"] = f"0/{total_pages}"
                     
                     # Procesar todas las páginas
-                    all_pages_text = []
-                    for page_num in range(total_pages):
-                        try:
-                            page_text = process_single_page(local_pdf, page_num)
-                            if page_text and page_text.strip():
-                                all_pages_text.append(page_text)
-                            
-                            # Actualizar progreso
-                            async_tasks[task_id]["progress"] = f"{page_num + 1}/{total_pages}"
-                            
-                            # Progreso cada 10 páginas
-                            if (page_num + 1) % 10 == 0:
-                                print(f"✅ Procesadas {page_num + 1}/{total_pages} páginas")
-                            
-                            # Limpiar memoria periódicamente
-                            gc.collect()
-                        except Exception as e:
-                            print(f"Error en página {page_num + 1}: {repr(e)}")
-                            continue
+                    def update_progress(pages_done: int):
+                        async_tasks[task_id]["progress"] = f"{pages_done}/{total_pages}"
+                    
+                    memory = JobMemory(tmpdir)
+                    all_pages_text = process_pdf_pages(local_pdf, total_pages, update_progress, memory, control)
+                    print(f"📊 Pico de RSS del proceso: {memory.peak_process_rss_mb} MB, subprocesos del trabajo: {memory.peak_subprocess_rss_mb} MB")
                     
                     if not all_pages_text:
                         async_tasks[task_id] = {
                             "state": "Error",
                             "progress": f"{total_pages}/{total_pages}",
-                            "error": "No se pudo extraer texto del PDF"
+                            "error": "No se pudo extraer texto del PDF",
+                            "peak_process_rss_mb": memory.peak_process_rss_mb,
+                            "peak_subprocess_rss_mb": memory.peak_subprocess_rss_mb,
+                            "quota_exceeded_pages": memory.quota_exceeded_pages,
+                            "timed_out_pages": control.timed_out_pages
                         }
                         return
                     
@@ -473,8 +1375,10 @@ async def process_single_pdf_async(req: ProcessPDFRequestAsync, background_tasks
                         f.write(document_text)
                     
                     # Subir a S3 en la estructura correcta
+                    control.check()
                     s3_key = f"{req.dest_prefix}/{filename}"
                     s3_client.upload_file(local_txt, req.source_bucket, s3_key)
+                    record_inventory_output(req.source_bucket, s3_key, local_txt, total_pages, req.source_bucket, req.source_pdf_key)
                     
                     print(f"✅ Archivo subido: {s3_key}")
                     
@@ -485,9 +1389,15 @@ async def process_single_pdf_async(req: ProcessPDFRequestAsync, background_tasks
                         "filename": filename,
                         "s3_key": s3_key,
                         "pages_processed": len(all_pages_text),
-                        "document_type": doc_type
+                        "document_type": doc_type,
+                        "peak_process_rss_mb": memory.peak_process_rss_mb,
+                        "peak_subprocess_rss_mb": memory.peak_subprocess_rss_mb,
+                        "quota_exceeded_pages": memory.quota_exceeded_pages,
+                        "timed_out_pages": control.timed_out_pages
                     }
                     
+                except JobCancelled:
+                    raise
                 except Exception as e:
                     async_tasks[task_id] = {
                         "state": "Error",
@@ -495,16 +1405,23 @@ async def process_single_pdf_async(req: ProcessPDFRequestAsync, background_tasks
                         "error": str(e)
                     }
                     
+        except JobCancelled:
+            print(f"🛑 Tarea cancelada: {task_id}")
+            async_tasks[task_id] = {
+                "state": "Cancelled",
+                "progress": async_tasks.get(task_id, {}).get("progress", "0/0")
+            }
         except Exception as e:
             async_tasks[task_id] = {
                 "state": "Error",
                 "progress": "0/0",
                 "error": str(e)
             }
+        finally:
+            task_controls.pop(task_id, None)
     
-    loop = asyncio.get_event_loop()
-    
-    loop.run_in_executor(thread_pool, process_pdf_background)
+    # Se usa el Future del pool para poder retirarlo de la cola si se cancela
+    control.future = thread_pool.submit(process_pdf_background)
     
     return {
         "message": "PDF enviado para procesamiento en segundo plano",
@@ -521,12 +1438,43 @@ async def get_async_task_state(task_id: str):
     
     task_info = async_tasks[task_id]
     
-    if task_info["state"].upper() in ["OK", "ERROR"]:
+    if task_info["state"].upper() in ["OK", "ERROR", "CANCELLED"]:
         task_result = async_tasks.pop(task_id)
         return task_result
         
     return task_info
 
+@app.delete("/ocr/async-state/{task_id}")
+async def cancel_async_task(task_id: str):
+    """Cancela una tarea asíncrona en cola o en ejecución y libera sus recursos"""
+    
+    if task_id not in async_tasks:
+        raise HTTPException(status_code=404, detail="Tarea no encontrada")
+    
+    control = task_controls.get(task_id)
+    if control is None or async_tasks[task_id]["state"].upper() in ["OK", "ERROR", "CANCELLED"]:
+        raise HTTPException(status_code=409, detail="La tarea ya finalizó")
+    
+    if control.cancel():
+        # Nunca llegó a ejecutarse: se retira de la cola
+        task_controls.pop(task_id, None)
+        async_tasks[task_id] = {
+            "state": "Cancelled",
+            "progress": async_tasks[task_id]["progress"]
+        }
+    else:
+        # En ejecución: el hilo se detiene en el siguiente punto de control
+        if async_tasks[task_id]["state"] == "In Progress":
+            async_tasks[task_id]["state"] = "Cancelling"
+    
+    print(f"🛑 Cancelación solicitada para la tarea: {task_id}")
+    
+    return {
+        "message": "Cancelación solicitada",
+        "task_id": task_id,
+        "state": async_tasks[task_id]["state"]
+    }
+
 @app.post("/ocr/process-multiple")
 async def process_multiple_pdfs(req: ProcessMultiplePDFsRequest):
     """Procesa múltiples PDFs de una lista específica"""
@@ -613,35 +1561,46 @@ async def process_folder(req: ProcessFolderRequest):
         raise HTTPException(status_code=500, detail=f"Error procesando carpeta: {e}")
 
 @app.get("/ocr/stats/{bucket}/{prefix:path}")
-async def get_folder_stats(bucket: str, prefix: str):
-    """Obtiene estadísticas de una carpeta en S3"""
+async def get_folder_stats(bucket: str, prefix: str, refresh: bool = False):
+    """
+    Obtiene estadísticas de una carpeta en S3 desde el inventario local. El primer acceso
+    a un prefijo lo indexa completo; luego se refresca incrementalmente en segundo plano
+    """
     try:
-        paginator = s3_client.get_paginator('list_objects_v2')
+        conn = get_inventory_connection()
+        try:
+            indexed = find_indexed_prefix(conn, bucket, prefix)
+        finally:
+            conn.close()
         
-        total_files = 0
-        total_size = 0
-        pdf_files = 0
-        txt_files = 0
+        refresh_mode = "none"
+        if indexed is None or refresh:
+            # Sin índice (o refresco forzado con reconciliación completa): listar antes de responder.
+            # Si hay un refresco en segundo plano del mismo prefijo se espera a que termine
+            await asyncio.to_thread(
+                refresh_prefix_inventory, bucket, prefix if indexed is None else indexed[0], full=refresh, wait=True
+            )
+            refresh_mode = "full"
+        elif time.time() - indexed[1] >= OCR_INVENTORY_REFRESH_SEC:
+            # Índice vencido: responder con lo indexado y refrescar en segundo plano (un refresco por prefijo)
+            refresh_mode = "background" if submit_inventory_refresh(bucket, indexed[0]) else "pending"
         
-        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
-            for obj in page.get('Contents', []):
-                total_files += 1
-                total_size += obj['Size']
-                
-                if obj['Key'].lower().endswith('.pdf'):
-                    pdf_files += 1
-                elif obj['Key'].endswith('.txt'):
-                    txt_files += 1
+        conn = get_inventory_connection()
+        try:
+            indexed = find_indexed_prefix(conn, bucket, prefix)
+            statistics = query_prefix_stats(conn, bucket, prefix)
+        finally:
+            conn.close()
         
         return {
             "bucket": bucket,
             "prefix": prefix,
-            "statistics": {
-                "total_files": total_files,
-                "total_size_mb": round(total_size / (1024 * 1024), 2),
-                "pdf_files": pdf_files,
-                "txt_files": txt_files,
-                "processed_ratio": f"{txt_files}/{pdf_files}" if pdf_files > 0 else "0/0"
+            "statistics": statistics,
+            "inventory": {
+                "indexed_prefix": indexed[0] if indexed else prefix,
+                "refresh": refresh_mode,
+                "age_sec": round(time.time() - indexed[1], 1) if indexed else None,
+                "full_refresh_age_sec": round(time.time() - indexed[2], 1) if indexed else None
             }
         }
         
@@ -658,4 +1617,5 @@ if __name__ == "__main__":
         # Limpiar el pool de hilos al cerrar
         print("🔄 Cerrando ThreadPool...")
         thread_pool.shutdown(wait=True)
+        inventory_pool.shutdown(wait=False)
         print("✅ ThreadPool cerrado correctamente")
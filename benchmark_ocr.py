@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import argparse
+import time
+
+from pdf2image import convert_from_path
+import pytesseract
+from PyPDF2 import PdfReader
+
+from app import (
+    OCR_RENDER_WIDTH,
+    enhance_image_quality,
+    get_optimal_config,
+    process_page_batch,
+)
+
+def bench_per_page(pdf_path: str, total_pages: int) -> float:
+    """Mide páginas/seg con la llamada actual: un render y un pytesseract.image_to_string por página"""
+    config = get_optimal_config()
+    start = time.perf_counter()
+
+    for page_num in range(total_pages):
+        images = convert_from_path(
+            pdf_path,
+            first_page=page_num + 1,
+            last_page=page_num + 1,
+            thread_count=1,
+            grayscale=True,
+            size=(OCR_RENDER_WIDTH, None)
+        )
+        for img in images:
+            pytesseract.image_to_string(enhance_image_quality(img), lang="spa", config=config)
+            img.close()
+
+    elapsed = time.perf_counter() - start
+    return total_pages / elapsed if elapsed > 0 else 0.0
+
+def bench_batched(pdf_path: str, total_pages: int, batch_size: int) -> float:
+    """
+    Mide páginas/seg agrupando batch_size páginas por invocación de tesseract.
+    Sin fallback por página: si un lote falla se lanza el error en vez de medir el OCR por página
+    """
+    pdf = PdfReader(pdf_path)
+    start = time.perf_counter()
+
+    page_num = 0
+    while page_num < total_pages:
+        last_page = min(total_pages, page_num + batch_size)
+        process_page_batch(pdf_path, page_num, last_page, pdf, fallback=False)
+        page_num = last_page
+
+    elapsed = time.perf_counter() - start
+    return total_pages / elapsed if elapsed > 0 else 0.0
+
+def main():
+    """Compara el OCR por página contra el OCR por lotes con varios tamaños de lote"""
+    parser = argparse.ArgumentParser(description="Benchmark de OCR por página vs. OCR por lotes")
+    parser.add_argument("pdf", help="Ruta local del PDF de prueba")
+    parser.add_argument("--pages", type=int, default=0, help="Número de páginas a procesar (0 = todas)")
+    parser.add_argument("--batch-sizes", default="1,4,8,16", help="Tamaños de lote separados por coma")
+    args = parser.parse_args()
+
+    total_pages = len(PdfReader(args.pdf).pages)
+    if args.pages > 0:
+        total_pages = min(total_pages, args.pages)
+    batch_sizes = [int(size) for size in args.batch_sizes.split(",") if size.strip()]
+
+    print("BENCHMARK OCR - PÁGINAS/SEG")
+    print(f"PDF: {args.pdf} ({total_pages} páginas)")
+    print("=" * 60)
+
+    baseline = bench_per_page(args.pdf, total_pages)
+    print(f"{'image_to_string por página':<30} {baseline:8.3f} pág/s")
+
+    for batch_size in batch_sizes:
+        label = f"lote de {batch_size} páginas"
+        try:
+            rate = bench_batched(args.pdf, total_pages, batch_size)
+        except Exception as e:
+            print(f"{label:<30} INVÁLIDO  ({repr(e)})")
+            continue
+        speedup = rate / baseline if baseline > 0 else 0.0
+        print(f"{label:<30} {rate:8.3f} pág/s  (x{speedup:.2f})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import os
+import shutil
+import stat
+import sys
+import textwrap
+
+import pytest
+import pytesseract
+from PyPDF2 import PdfWriter
+
+import app
+
+
+FAKE_TESSERACT = """\
+#!{python}
+# Tesseract falso: escribe "texto de <imagen>" por cada imagen de la lista, seguido
+# del separador de página recibido con -c page_separator=...
+import os, sys, time
+
+args = sys.argv[1:]
+separator = ""
+for i, arg in enumerate(args):
+    if arg == "-c" and args[i + 1].startswith("page_separator="):
+        separator = args[i + 1].split("=", 1)[1]
+
+source = args[0]
+# Como tesseract: "stdout" o la base del archivo de salida <base>.txt
+out = sys.stdout if args[1] == "stdout" else open(args[1] + ".txt", "w")
+if source.endswith(".txt"):
+    with open(source) as f:
+        images = [line.strip() for line in f if line.strip()]
+else:
+    images = [source]
+
+mode = os.environ.get("FAKE_TESSERACT_MODE", "ok")
+delay = float(os.environ.get("FAKE_TESSERACT_DELAY", "0"))
+for i, image in enumerate(images):
+    if mode == "hang" or (mode == "hang-second" and i == 1):
+        time.sleep(60)
+    if mode == "fail":
+        sys.stderr.write("fallo simulado")
+        sys.exit(1)
+    time.sleep(delay)
+    out.write("texto de " + os.path.basename(image) + "\\n")
+    if mode != "nosep":
+        out.write(separator)
+    out.flush()
+"""
+
+
+FAKE_PDFTOPPM = """\
+#!{python}
+# pdftoppm falso: escribe una imagen en blanco por página con los nombres de pdftoppm
+import os, sys, time
+from PIL import Image
+
+args = sys.argv[1:]
+first = int(args[args.index("-f") + 1])
+last = int(args[args.index("-l") + 1])
+prefix = args[-1]
+single = "-singlefile" in args
+
+mode = os.environ.get("FAKE_PDFTOPPM_MODE", "ok")
+for page in range(first, last + 1):
+    if mode == "hang" or (mode == "hang-second" and page == first + 1):
+        time.sleep(60)
+    path = prefix + ".png" if single else "%s-%02d.png" % (prefix, page)
+    Image.new("L", (20, 20), 255).save(path)
+"""
+
+
+def write_script(path, content):
+    path.write_text(textwrap.dedent(content).format(python=sys.executable))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+@pytest.fixture
+def fake_tesseract(tmp_path, monkeypatch):
+    """Reemplaza el binario de tesseract por un script que responde al instante"""
+    cmd = write_script(tmp_path / "tesseract", FAKE_TESSERACT)
+    monkeypatch.setattr(pytesseract.pytesseract, "tesseract_cmd", cmd)
+    monkeypatch.delenv("FAKE_TESSERACT_MODE", raising=False)
+    monkeypatch.delenv("FAKE_TESSERACT_DELAY", raising=False)
+    return cmd
+
+
+@pytest.fixture
+def fake_pdftoppm(tmp_path, monkeypatch):
+    """Reemplaza el binario de pdftoppm por un script que escribe imágenes en blanco"""
+    cmd = write_script(tmp_path / "pdftoppm", FAKE_PDFTOPPM)
+    monkeypatch.setattr(app, "PDFTOPPM_CMD", cmd)
+    monkeypatch.delenv("FAKE_PDFTOPPM_MODE", raising=False)
+    return cmd
+
+
+@pytest.fixture
+def blank_pdf(tmp_path):
+    """PDF real de tres páginas en blanco, para el código que abre el archivo con PdfReader"""
+    writer = PdfWriter()
+    for _ in range(3):
+        writer.add_blank_page(width=612, height=1008)
+    path = tmp_path / "doc.pdf"
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+class FakeBox:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+
+class FakePage:
+    def __init__(self, width=612, height=1008, text=""):
+        self.mediabox = FakeBox(width, height)
+        self.text = text
+
+    def extract_text(self):
+        return self.text
+
+
+class FakePdf:
+    """Sustituto mínimo de PdfReader: páginas con mediabox y capa de texto"""
+
+    def __init__(self, pages):
+        self.pages = pages
+
+
+class StubPaginator:
+    def __init__(self, s3):
+        self.s3 = s3
+
+    def paginate(self, Bucket, Prefix, StartAfter="", PageSize=2):
+        self.s3.list_calls.append({"Prefix": Prefix, "StartAfter": StartAfter})
+        keys = sorted(key for key in self.s3.objects.get(Bucket, {}) if key.startswith(Prefix) and key > StartAfter)
+        for i in range(0, len(keys), PageSize):
+            yield {"Contents": [{"Key": key, "Size": self.s3.objects[Bucket][key]} for key in keys[i:i + PageSize]]}
+
+
+class StubS3:
+    """Cliente S3 mínimo: list_objects_v2 paginado en orden alfabético, como S3"""
+
+    def __init__(self):
+        self.objects = {}
+        self.list_calls = []
+        # Archivos locales que sirve download_file, por (bucket, llave)
+        self.files = {}
+
+    def put(self, bucket, key, size=100):
+        self.objects.setdefault(bucket, {})[key] = size
+
+    def delete(self, bucket, key):
+        del self.objects[bucket][key]
+
+    def get_paginator(self, name):
+        assert name == "list_objects_v2"
+        return StubPaginator(self)
+
+    def download_file(self, bucket, key, path):
+        shutil.copyfile(self.files[(bucket, key)], path)
+
+    def upload_file(self, path, bucket, key):
+        self.put(bucket, key, os.path.getsize(path))
+
+
+@pytest.fixture
+def stub_s3(tmp_path, monkeypatch):
+    """S3 simulado y un inventario SQLite vacío en un directorio temporal"""
+    s3 = StubS3()
+    monkeypatch.setattr(app, "s3_client", s3)
+    monkeypatch.setattr(app, "OCR_INVENTORY_DB", str(tmp_path / "inventory.db"))
+    return s3
@@ -0,0 +1,59 @@
+import pytest
+
+import app
+from tests.conftest import FakePage, FakePdf
+
+
+def test_split_batch_output_drops_trailing_separator():
+    sep = app.OCR_PAGE_SEPARATOR
+    output = f"uno{sep}dos{sep}tres{sep}"
+    assert app.split_batch_output(output, 3) == ["uno", "dos", "tres"]
+
+
+def test_split_batch_output_keeps_empty_pages():
+    sep = app.OCR_PAGE_SEPARATOR
+    assert app.split_batch_output(f"uno{sep}{sep}tres{sep}\n", 3) == ["uno", "", "tres"]
+
+
+def test_split_batch_output_rejects_page_count_mismatch():
+    sep = app.OCR_PAGE_SEPARATOR
+    assert app.split_batch_output(f"uno{sep}dos{sep}", 3) is None
+    assert app.split_batch_output(f"uno{sep}dos", 2) is None
+    assert app.split_batch_output("sin separadores", 2) is None
+
+
+def test_compute_batch_size_limited_by_memory(monkeypatch):
+    pdf = FakePdf([FakePage(612, 792)])
+    raster = int(app.OCR_RENDER_WIDTH * app.OCR_RENDER_WIDTH * 792 / 612)
+    budget_pages = 3
+    available = raster * 4 * budget_pages * app.MAX_WORKERS / app.OCR_BATCH_MEMORY_FRACTION
+    monkeypatch.setattr(app, "get_available_memory_bytes", lambda: int(available) + 1)
+    assert app.compute_batch_size(pdf, 0, max_pages=16) == budget_pages
+
+
+def test_compute_batch_size_limited_by_spill_quota(monkeypatch):
+    pdf = FakePdf([FakePage(612, 792)])
+    raster = int(app.OCR_RENDER_WIDTH * app.OCR_RENDER_WIDTH * 792 / 612)
+    monkeypatch.setattr(app, "get_available_memory_bytes", lambda: 0)
+    assert app.compute_batch_size(pdf, 0, max_pages=16, spill_quota_bytes=raster * 2 * 5) == 5
+    assert app.compute_batch_size(pdf, 0, max_pages=16) == 16
+
+
+def test_compute_batch_size_never_below_one(monkeypatch):
+    monkeypatch.setattr(app, "get_available_memory_bytes", lambda: 1)
+    assert app.compute_batch_size(FakePdf([FakePage()]), 0, max_pages=16) == 1
+
+
+def test_process_page_batch_splits_pages(tmp_path, fake_tesseract, fake_pdftoppm):
+    texts = app.process_page_batch("doc.pdf", 0, 3, FakePdf([FakePage()] * 3))
+    assert [text.strip() for text in texts] == [
+        "texto de page-00000.png",
+        "texto de page-00001.png",
+        "texto de page-00002.png",
+    ]
+
+
+def test_process_page_batch_without_fallback_raises(monkeypatch, fake_tesseract, fake_pdftoppm):
+    monkeypatch.setenv("FAKE_TESSERACT_MODE", "nosep")
+    with pytest.raises(RuntimeError):
+        app.process_page_batch("doc.pdf", 0, 3, FakePdf([FakePage()] * 3), fallback=False)
@@ -0,0 +1,124 @@
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import app
+from tests.conftest import FakePage, FakePdf
+
+
+def test_run_kills_process_on_timeout():
+    control = app.JobControl()
+    started = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        control.run([sys.executable, "-c", "import time; time.sleep(30)"], timeout=0.5)
+    assert time.monotonic() - started < 3
+    assert not control.processes
+
+
+def test_cancel_stops_running_process_promptly():
+    control = app.JobControl()
+    threading.Timer(0.3, control.cancel).start()
+    started = time.monotonic()
+    with pytest.raises(app.JobCancelled):
+        control.run([sys.executable, "-c", "import time; time.sleep(30)"], timeout=None)
+    assert time.monotonic() - started < 2
+
+
+def test_cancel_dequeues_pending_future():
+    control = app.JobControl()
+    control.future = app.Future()
+    assert control.cancel() is True
+    assert control.cancelled
+
+
+def test_page_deadline_capped_by_document_deadline():
+    control = app.JobControl(page_timeout=100, document_timeout=1)
+    assert control.page_deadline() <= control.document_deadline
+    unlimited = app.JobControl(page_timeout=0, document_timeout=0)
+    assert unlimited.page_deadline() is None
+
+
+def test_remaining_raises_after_deadline():
+    control = app.JobControl()
+    with pytest.raises(TimeoutError):
+        control.remaining(time.monotonic() - 1)
+    control.cancel()
+    with pytest.raises(app.JobCancelled):
+        control.remaining(None)
+
+
+def test_hung_render_times_out_and_uses_text_layer(tmp_path, monkeypatch, fake_tesseract, fake_pdftoppm):
+    monkeypatch.setenv("FAKE_PDFTOPPM_MODE", "hang")
+    control = app.JobControl(page_timeout=0.5)
+    pdf = FakePdf([FakePage(text="capa de texto")])
+
+    started = time.monotonic()
+    text = app.process_single_page("doc.pdf", 0, app.JobMemory(str(tmp_path)), control, pdf)
+
+    assert time.monotonic() - started < 3
+    assert text == "capa de texto"
+    assert control.timed_out_pages == [1]
+
+
+def test_cancel_kills_hung_render(tmp_path, monkeypatch, blank_pdf, fake_tesseract, fake_pdftoppm):
+    monkeypatch.setenv("FAKE_PDFTOPPM_MODE", "hang")
+    control = app.JobControl(page_timeout=300)
+    threading.Timer(0.3, control.cancel).start()
+
+    started = time.monotonic()
+    with pytest.raises(app.JobCancelled):
+        app.process_pdf_pages(blank_pdf, 3, memory=app.JobMemory(str(tmp_path)), control=control)
+    assert time.monotonic() - started < 2
+
+
+def test_batch_deadline_is_one_page_timeout_plus_allowance(monkeypatch):
+    monkeypatch.setattr(app, "OCR_BATCH_PAGE_ALLOWANCE_SEC", 10)
+    control = app.JobControl(page_timeout=300)
+    now = time.monotonic()
+    assert control.page_deadline(16) - now == pytest.approx(300 + 15 * 10, abs=1)
+
+
+def test_batch_timeout_keeps_finished_pages(tmp_path, monkeypatch, fake_tesseract, fake_pdftoppm):
+    monkeypatch.setattr(app, "OCR_BATCH_PAGE_ALLOWANCE_SEC", 0.5)
+    monkeypatch.setenv("FAKE_TESSERACT_MODE", "hang-second")
+    control = app.JobControl(page_timeout=0.5)
+    pdf = FakePdf([FakePage(text=f"capa {i}") for i in range(3)])
+
+    started = time.monotonic()
+    texts = app.process_page_batch("doc.pdf", 0, 3, pdf, app.JobMemory(str(tmp_path)), control)
+
+    assert time.monotonic() - started < 5
+    # La página 1 viene del lote, la 2 colgó el lote y la 3 se procesa sola
+    assert [text.strip() for text in texts] == ["texto de page-00000.png", "capa 1", "texto de ocr.png"]
+    assert control.timed_out_pages == [2]
+
+
+def test_batch_timeout_retries_slow_but_healthy_page(tmp_path, monkeypatch, fake_tesseract, fake_pdftoppm):
+    # Cada página tarda 0.5 s: el lote de 4 vence a los 1.9 s con la cuarta a medias,
+    # pero esa página no superó por sí sola el timeout de 1 s
+    monkeypatch.setattr(app, "OCR_BATCH_PAGE_ALLOWANCE_SEC", 0.3)
+    monkeypatch.setenv("FAKE_TESSERACT_DELAY", "0.5")
+    control = app.JobControl(page_timeout=1)
+    pdf = FakePdf([FakePage(text=f"capa {i}") for i in range(4)])
+
+    texts = app.process_page_batch("doc.pdf", 0, 4, pdf, app.JobMemory(str(tmp_path)), control)
+
+    assert [text.strip() for text in texts] == [
+        "texto de page-00000.png", "texto de page-00001.png", "texto de page-00002.png", "texto de ocr.png"
+    ]
+    assert control.timed_out_pages == []
+
+
+def test_batch_render_timeout_skips_hung_page(tmp_path, monkeypatch, fake_tesseract, fake_pdftoppm):
+    monkeypatch.setattr(app, "OCR_BATCH_PAGE_ALLOWANCE_SEC", 0.5)
+    monkeypatch.setenv("FAKE_PDFTOPPM_MODE", "hang-second")
+    control = app.JobControl(page_timeout=0.5)
+    pdf = FakePdf([FakePage(text=f"capa {i}") for i in range(3)])
+
+    texts = app.process_page_batch("doc.pdf", 0, 3, pdf, app.JobMemory(str(tmp_path)), control)
+
+    assert [text.strip() for text in texts] == ["texto de ocr.png", "capa 1", "texto de ocr.png"]
+    assert control.timed_out_pages == [2]
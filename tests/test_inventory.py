@@ -0,0 +1,235 @@
+import app
+
+
+def stats(bucket, prefix):
+    conn = app.get_inventory_connection()
+    try:
+        return app.query_prefix_stats(conn, bucket, prefix)
+    finally:
+        conn.close()
+
+
+def test_incremental_refresh_uses_s3_cursor(stub_s3):
+    stub_s3.put("b", "p/100/a.pdf")
+    stub_s3.put("b", "p/500/b.pdf")
+    app.refresh_prefix_inventory("b", "p/")
+
+    stub_s3.put("b", "p/700/c.pdf")
+    app.refresh_prefix_inventory("b", "p/")
+
+    assert stub_s3.list_calls[-1]["StartAfter"] == "p/500/b.pdf"
+    assert stats("b", "p/")["pdf_files"] == 3
+
+
+def test_pipeline_outputs_do_not_move_cursor(stub_s3, tmp_path):
+    stub_s3.put("b", "p/100/a.pdf")
+    app.refresh_prefix_inventory("b", "p/")
+
+    local_txt = tmp_path / "out.txt"
+    local_txt.write_text("texto")
+    app.record_inventory_output("b", "p/900/out.txt", str(local_txt), 1, "b", "p/100/a.pdf")
+    stub_s3.put("b", "p/900/out.txt")
+    stub_s3.put("b", "p/600/new.pdf")
+    app.refresh_prefix_inventory("b", "p/")
+
+    assert stub_s3.list_calls[-1]["StartAfter"] == "p/100/a.pdf"
+    assert stats("b", "p/")["pdf_files"] == 2
+
+
+def test_full_refresh_sees_keys_before_cursor_and_deletes(stub_s3, monkeypatch):
+    stub_s3.put("b", "p/100/a.pdf")
+    stub_s3.put("b", "p/500/b.pdf")
+    app.refresh_prefix_inventory("b", "p/")
+
+    stub_s3.put("b", "p/200/new.pdf")
+    stub_s3.delete("b", "p/100/a.pdf")
+    app.refresh_prefix_inventory("b", "p/")
+    # El incremental no ve la llave anterior al cursor
+    assert stats("b", "p/")["pdf_files"] == 2
+
+    monkeypatch.setattr(app, "OCR_INVENTORY_FULL_REFRESH_SEC", 0)
+    app.refresh_prefix_inventory("b", "p/")
+    assert stub_s3.list_calls[-1]["StartAfter"] == ""
+    assert stats("b", "p/")["files_by_type"] == {"pdf": 2}
+
+
+def test_cursor_column_added_to_existing_database(stub_s3):
+    conn = app.sqlite3.connect(app.OCR_INVENTORY_DB)
+    conn.execute(
+        "CREATE TABLE prefixes (bucket TEXT NOT NULL, prefix TEXT NOT NULL, refreshed_at REAL NOT NULL, "
+        "full_refreshed_at REAL NOT NULL, PRIMARY KEY (bucket, prefix))"
+    )
+    conn.close()
+
+    stub_s3.put("b", "p/1.pdf")
+    app.refresh_prefix_inventory("b", "p/")
+    assert stats("b", "p/")["pdf_files"] == 1
+
+
+def test_pending_uses_recorded_source_key(stub_s3, tmp_path):
+    stub_s3.put("b", "digitalizaciones_csj/111/tomo 1.pdf")
+    stub_s3.put("b", "digitalizaciones_csj/222/tomo 1.pdf")
+    app.refresh_prefix_inventory("b", "digitalizaciones_csj/")
+
+    local_txt = tmp_path / "tomo 1.txt"
+    local_txt.write_text("texto")
+    app.record_inventory_output(
+        "b", "processing/otro/resources/split_text/tomo 1.txt", str(local_txt), 3,
+        "b", "digitalizaciones_csj/111/tomo 1.pdf"
+    )
+
+    # Solo el PDF de la carpeta 111 tiene salida; el homónimo de la 222 sigue pendiente
+    assert stats("b", "digitalizaciones_csj/")["pending_pdfs"] == 1
+
+
+def test_pending_falls_back_to_stem_in_same_folder_id(stub_s3):
+    stub_s3.put("b", "digitalizaciones_csj/111/tomo 1.pdf")
+    stub_s3.put("b", "digitalizaciones_csj/222/tomo 1.pdf")
+    stub_s3.put("b", "processing/111/resources/split_text/tomo 1.txt")
+    app.refresh_prefix_inventory("b", "digitalizaciones_csj/")
+    app.refresh_prefix_inventory("b", "processing/")
+
+    assert stats("b", "digitalizaciones_csj/")["pending_pdfs"] == 1
+
+
+def test_pending_with_repeated_filenames_at_volume(stub_s3):
+    import time
+
+    folders = [f"1100131030312002{i:07d}" for i in range(20000)]
+    objects = []
+    for folder_id in folders:
+        objects.append({"Key": f"digitalizaciones_csj/{folder_id}/tomo 1.pdf", "Size": 100})
+        objects.append({"Key": f"digitalizaciones_csj/{folder_id}/tomo 2.pdf", "Size": 100})
+    for folder_id in folders[::2]:
+        objects.append({"Key": f"processing/{folder_id}/resources/split_text/tomo 1.txt", "Size": 10})
+
+    conn = app.get_inventory_connection()
+    try:
+        app.upsert_inventory_objects(conn, "b", objects, time.time())
+        conn.commit()
+        start = time.perf_counter()
+        result = app.query_prefix_stats(conn, "b", "digitalizaciones_csj/")
+        elapsed = time.perf_counter() - start
+        plan = " ".join(row[-1] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT 1 FROM objects WHERE bucket = 'b' AND ext = 'txt' "
+            "AND stem = 'tomo 1' AND folder_id = 'x'"
+        ))
+    finally:
+        conn.close()
+
+    assert result["pending_pdfs"] == 30000
+    assert "objects_folder" in plan
+    assert elapsed < 2
+
+
+def test_folder_id_backfilled_on_existing_database(stub_s3):
+    conn = app.sqlite3.connect(app.OCR_INVENTORY_DB)
+    conn.executescript("""
+        CREATE TABLE objects (bucket TEXT NOT NULL, key TEXT NOT NULL, size INTEGER NOT NULL,
+            ext TEXT NOT NULL, stem TEXT NOT NULL, seen_at REAL NOT NULL, PRIMARY KEY (bucket, key));
+        INSERT INTO objects VALUES ('b', 'digitalizaciones_csj/111/tomo 1.pdf', 1, 'pdf', 'tomo 1', 0);
+        INSERT INTO objects VALUES ('b', 'processing/111/resources/split_text/tomo 1.txt', 1, 'txt', 'tomo 1', 0);
+    """)
+    conn.close()
+
+    assert stats("b", "digitalizaciones_csj/")["pending_pdfs"] == 0
+
+
+def test_throughput_counts_recorded_outputs(stub_s3, tmp_path):
+    local_txt = tmp_path / "out.txt"
+    local_txt.write_text("texto")
+    app.record_inventory_output("b", "processing/1/out.txt", str(local_txt), 7, "b", "src/1/out.pdf")
+    app.record_inventory_output("b", "processing/2/out.txt", str(local_txt), 3, "b", "src/2/out.pdf")
+
+    throughput = stats("b", "processing/")["throughput"]
+    assert throughput["documents"] == 2
+    assert throughput["pages"] == 10
+
+
+def test_forced_refresh_waits_for_running_refresh(stub_s3, monkeypatch):
+    import threading
+
+    stub_s3.put("b", "p/500/b.pdf")
+    app.refresh_prefix_inventory("b", "p/")
+
+    listing = threading.Event()
+    release = threading.Event()
+    paginate = app.s3_client.get_paginator("list_objects_v2").paginate
+
+    class BlockingPaginator:
+        def paginate(self, **kwargs):
+            if not listing.is_set():
+                listing.set()
+                release.wait(5)
+            return paginate(**kwargs)
+
+    monkeypatch.setattr(stub_s3, "get_paginator", lambda name: BlockingPaginator())
+    background = threading.Thread(target=app.refresh_prefix_inventory, args=("b", "p/"))
+    background.start()
+    assert listing.wait(5)
+
+    # Sin wait se omite; con wait espera al refresco en curso y hace su propia reconciliación
+    assert app.refresh_prefix_inventory("b", "p/") is False
+    stub_s3.put("b", "p/100/a.pdf")
+    forced = threading.Thread(target=app.refresh_prefix_inventory, args=("b", "p/"), kwargs={"full": True, "wait": True})
+    forced.start()
+    release.set()
+    background.join(5)
+    forced.join(5)
+
+    assert stub_s3.list_calls[-1]["StartAfter"] == ""
+    assert stats("b", "p/")["pdf_files"] == 2
+
+
+def test_background_refresh_is_not_queued_twice(stub_s3, monkeypatch):
+    import threading
+
+    stub_s3.put("b", "p/1.pdf")
+    listing = threading.Event()
+    release = threading.Event()
+    paginate = app.s3_client.get_paginator("list_objects_v2").paginate
+
+    class BlockingPaginator:
+        def paginate(self, **kwargs):
+            listing.set()
+            release.wait(5)
+            return paginate(**kwargs)
+
+    monkeypatch.setattr(stub_s3, "get_paginator", lambda name: BlockingPaginator())
+    assert app.submit_inventory_refresh("b", "p/") is True
+    assert listing.wait(5)
+    # Polls durante el refresco lento no encolan más refrescos
+    assert not any(app.submit_inventory_refresh("b", "p/") for _ in range(10))
+    release.set()
+    app.inventory_pool.submit(lambda: None).result(5)
+
+    assert len(stub_s3.list_calls) == 1
+    assert app.submit_inventory_refresh("b", "p/") is True
+    app.inventory_pool.submit(lambda: None).result(5)
+    assert len(stub_s3.list_calls) == 2
+
+
+def test_background_refresh_errors_are_logged(stub_s3, monkeypatch, capsys):
+    class FailingPaginator:
+        def paginate(self, **kwargs):
+            raise PermissionError("AccessDenied")
+
+    monkeypatch.setattr(stub_s3, "get_paginator", lambda name: FailingPaginator())
+    assert app.submit_inventory_refresh("b", "p/") is True
+    app.inventory_pool.submit(lambda: None).result(5)
+
+    assert "AccessDenied" in capsys.readouterr().out
+    assert ("b", "p/") not in app.inventory_pending
+
+
+def test_processed_pdf_records_all_pages(stub_s3, monkeypatch, blank_pdf):
+    import asyncio
+
+    stub_s3.files[("b", "src/1/doc.pdf")] = blank_pdf
+    # Solo una de las tres páginas produce texto
+    monkeypatch.setattr(app, "process_pdf_pages", lambda *args, **kwargs: ["texto de la página 2"])
+    asyncio.run(app.process_single_pdf(app.ProcessPDFRequest(
+        source_bucket="b", source_pdf_key="src/1/doc.pdf", dest_bucket="b", dest_key="processing/1/doc.txt"
+    )))
+
+    assert stats("b", "processing/")["throughput"]["pages"] == 3
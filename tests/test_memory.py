@@ -0,0 +1,136 @@
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import app
+from tests.conftest import FakePage, FakePdf
+
+
+ALLOCATE_AND_WAIT = "buf = bytearray(64 * 1024 * 1024); import time; time.sleep(1)"
+
+
+def test_total_rss_includes_live_subprocesses(tmp_path):
+    control = app.JobControl()
+    control.memory = app.JobMemory(str(tmp_path))
+    samples = []
+
+    def watch():
+        while not control.processes:
+            time.sleep(0.01)
+        time.sleep(0.5)
+        samples.append((app.get_rss_bytes(), app.get_total_rss_bytes()))
+
+    watcher = threading.Thread(target=watch)
+    watcher.start()
+    control.run([sys.executable, "-c", ALLOCATE_AND_WAIT], timeout=10)
+    watcher.join()
+
+    own_rss, total_rss = samples[0]
+    assert total_rss - own_rss >= 64 * 1024 * 1024
+    assert not app.child_pids
+
+
+def test_job_memory_tracks_subprocess_peak(tmp_path):
+    memory = app.JobMemory(str(tmp_path))
+    control = app.JobControl()
+    control.memory = memory
+    control.run([sys.executable, "-c", ALLOCATE_AND_WAIT], timeout=10)
+
+    assert memory.peak_subprocess_rss_bytes >= 64 * 1024 * 1024
+    assert memory.peak_process_rss_bytes >= memory.peak_subprocess_rss_bytes
+
+
+def test_subprocess_peak_read_when_child_exits_before_first_poll(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "OCR_CANCEL_POLL_SEC", 5)
+    memory = app.JobMemory(str(tmp_path))
+    control = app.JobControl()
+    control.memory = memory
+    control.run([sys.executable, "-c", "buf = bytearray(64 * 1024 * 1024)"], timeout=10)
+
+    assert memory.peak_subprocess_rss_bytes >= 64 * 1024 * 1024
+
+
+def test_subprocess_peak_read_for_killed_child(tmp_path):
+    memory = app.JobMemory(str(tmp_path))
+    control = app.JobControl()
+    control.memory = memory
+    with pytest.raises(subprocess.TimeoutExpired):
+        control.run([sys.executable, "-c", ALLOCATE_AND_WAIT.replace("sleep(1)", "sleep(30)")], timeout=0.5)
+
+    assert memory.peak_subprocess_rss_bytes >= 64 * 1024 * 1024
+
+
+def test_throttle_waits_while_over_ceiling(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "OCR_RSS_CEILING_MB", 1)
+    monkeypatch.setattr(app, "OCR_RSS_POLL_SEC", 0.01)
+    monkeypatch.setattr(app, "get_total_rss_bytes", lambda: 2 * 1024 * 1024)
+    first = app.JobMemory(str(tmp_path / "a"))
+    second = app.JobMemory(str(tmp_path / "b"))
+    entered = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with first.throttle():
+            entered.set()
+            release.wait(5)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    entered.wait(5)
+
+    started = time.monotonic()
+    threading.Timer(0.2, release.set).start()
+    # Sobre el techo con otra página en curso: espera a que esta termine
+    with second.throttle():
+        waited = time.monotonic() - started
+    holder.join()
+
+    assert waited >= 0.15
+    assert app.render_state["active"] == 0
+
+
+def test_throttle_does_not_block_when_alone(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "OCR_RSS_CEILING_MB", 1)
+    monkeypatch.setattr(app, "get_total_rss_bytes", lambda: 2 * 1024 * 1024)
+    with app.JobMemory(str(tmp_path)).throttle():
+        assert app.render_state["active"] == 1
+
+
+def test_reserve_rejects_projected_overflow(tmp_path):
+    memory = app.JobMemory(str(tmp_path), spill_quota_bytes=1000)
+    (tmp_path / "spill" / "previo.png").write_bytes(b"x" * 600)
+    memory.reserve(400)
+    try:
+        memory.reserve(401)
+    except app.SpillQuotaExceeded:
+        pass
+    else:
+        raise AssertionError("se esperaba SpillQuotaExceeded")
+
+
+def test_quota_checked_before_rendering(tmp_path, monkeypatch, fake_tesseract):
+    rendered = []
+    monkeypatch.setattr(app, "render_pages", lambda *args, **kwargs: rendered.append(args) or [])
+    memory = app.JobMemory(str(tmp_path), spill_quota_bytes=1024)
+    pdf = FakePdf([FakePage(text="capa de texto")])
+
+    text = app.process_single_page("doc.pdf", 0, memory, app.JobControl(), pdf)
+
+    assert rendered == []
+    assert text == "capa de texto"
+    assert memory.quota_exceeded_pages == [1]
+
+
+def test_batch_over_quota_falls_back_per_page(tmp_path, fake_tesseract, fake_pdftoppm):
+    pdf = FakePdf([FakePage(612, 792)] * 4)
+    raster = app.estimate_raster_bytes(pdf, 0)
+    # Alcanza para una página (imagen renderizada + mejorada) pero no para el lote
+    memory = app.JobMemory(str(tmp_path), spill_quota_bytes=raster * 2 + 1)
+
+    texts = app.process_page_batch("doc.pdf", 0, 4, pdf, memory, app.JobControl())
+
+    assert [text.strip() for text in texts] == ["texto de ocr.png"] * 4
+    assert memory.quota_exceeded_pages == []